@@ -1,30 +1,70 @@
 import os
 import sys
+import asyncio
 import logging
 from typing import List
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import ORJSONResponse, HTMLResponse
 from PIL import Image
 import io
-import tempfile
+import hashlib
 import uvicorn
 import traceback
+from collections import OrderedDict
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 import gc
+import numpy as np
+from models.mock_models import MockFeatureExtractor, MockCaptionGenerator
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    from models.feature_extractor import FeatureExtractor
+    from models.caption_generator import CaptionGenerator
+except Exception as e:
+    logger.warning(f"Production model modules unavailable: {e}")
+    FeatureExtractor = CaptionGenerator = None
+
 models = {}
+inference_queue = None
+inference_semaphore = None
+caption_cache = OrderedDict()
+executor = None
+
+READ_CHUNK_SIZE = 1 << 20
+MULTIPART_OVERHEAD = 64 * 1024
+IMAGE_SIGNATURES = (
+    b"\xff\xd8\xff",
+    b"\x89PNG\r\n\x1a\n",
+    b"GIF87a",
+    b"GIF89a",
+    b"BM",
+)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global inference_queue, inference_semaphore, executor
     logger.info("🚀 Starting Enhanced Image Caption Generator API")
-    await load_models()
+    if not models:
+        load_models()
+    app.state.root_html = render_root(models.get("status", "unknown")).encode()
+    executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+    inference_queue = asyncio.Queue()
+    inference_semaphore = asyncio.Semaphore(get_config()["max_inflight"])
+    batcher = asyncio.create_task(batch_worker(inference_queue))
     yield
     logger.info("🛑 Shutting down API")
+    batcher.cancel()
+    try:
+        await batcher
+    except asyncio.CancelledError:
+        pass
+    executor.shutdown(wait=False)
+    caption_cache.clear()
     models.clear()
     gc.collect()
 
@@ -34,18 +74,52 @@ app = FastAPI(
     version="2.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
-app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
+def max_body_size(path):
+    if path == "/generate-caption":
+        return get_config()["max_file_size"] + MULTIPART_OVERHEAD
+    if path == "/batch-generate":
+        config = get_config()
+        return config["max_batch_size"] * config["max_file_size"] + MULTIPART_OVERHEAD
+    return None
+
+class BodySizeLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        limit = max_body_size(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        
+        try:
+            content_length = int(dict(scope["headers"]).get(b"content-length", b"0"))
+        except ValueError:
+            response = ORJSONResponse(status_code=400, content={"detail": "Invalid Content-Length"})
+        else:
+            if content_length <= limit:
+                await self.app(scope, receive, send)
+                return
+            response = ORJSONResponse(status_code=413, content={"detail": "File too large"})
+        await response(scope, receive, send)
+
+app.add_middleware(BodySizeLimitMiddleware)
+
+allowed_hosts = os.getenv("ALLOWED_HOSTS", "*").split(",")
+if allowed_hosts != ["*"]:
+    app.add_middleware(TrustedHostMiddleware, allowed_hosts=allowed_hosts)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
-        "https://captionit-beta.vercel.app/"
-        "https://*.vercel.app",
+        "https://captionit-beta.vercel.app",
         "https://vercel.app",
     ],
+    allow_origin_regex=r"https://[a-z0-9-]+\.vercel\.app",
     allow_credentials=False,
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
@@ -58,10 +132,14 @@ def get_config():
         "tokenizer_path": os.getenv("TOKENIZER_PATH", "models/tokenizer.pkl"),
         "max_file_size": int(os.getenv("MAX_FILE_SIZE_MB", "10")) * 1024 * 1024,
         "max_batch_size": int(os.getenv("MAX_BATCH_SIZE", "3")),
+        "inference_batch_size": int(os.getenv("INFERENCE_BATCH_SIZE", "8")),
+        "batch_timeout_ms": int(os.getenv("BATCH_TIMEOUT_MS", "20")),
+        "max_inflight": int(os.getenv("MAX_INFLIGHT", "16")),
+        "cache_size": int(os.getenv("CACHE_SIZE", "256")),
         "allowed_extensions": os.getenv("ALLOWED_EXTENSIONS", "jpg,jpeg,png,bmp,gif").split(","),
     }
 
-async def load_models():
+def load_models():
     global models
     config = get_config()
     
@@ -70,8 +148,8 @@ async def load_models():
         
         if os.path.exists(config["model_path"]) and os.path.exists(config["tokenizer_path"]):
             try:
-                from models.feature_extractor import FeatureExtractor
-                from models.caption_generator import CaptionGenerator
+                if FeatureExtractor is None or CaptionGenerator is None:
+                    raise ImportError("Production model modules are not available")
                 
                 models["feature_extractor"] = FeatureExtractor()
                 models["caption_generator"] = CaptionGenerator(
@@ -84,7 +162,6 @@ async def load_models():
                 logger.error(f"Failed to load production models: {e}")
                 raise
         else:
-            from models.mock_models import MockFeatureExtractor, MockCaptionGenerator
             models["feature_extractor"] = MockFeatureExtractor()
             models["caption_generator"] = MockCaptionGenerator()
             models["status"] = "mock"
@@ -92,22 +169,185 @@ async def load_models():
             
     except Exception as e:
         logger.error(f"Critical error: {e}")
-        from models.mock_models import MockFeatureExtractor, MockCaptionGenerator
         models["feature_extractor"] = MockFeatureExtractor()
         models["caption_generator"] = MockCaptionGenerator()
         models["status"] = "fallback"
 
+if os.getenv("PRELOAD"):
+    load_models()
+
+async def read_upload(file, max_size):
+    if file.size is not None and file.size > max_size:
+        raise HTTPException(status_code=413, detail="File too large")
+    
+    buf = io.BytesIO()
+    while chunk := await file.read(READ_CHUNK_SIZE):
+        if not buf.tell() and not chunk.startswith(IMAGE_SIGNATURES):
+            raise HTTPException(status_code=400, detail="Unsupported image format")
+        if buf.tell() + len(chunk) > max_size:
+            raise HTTPException(status_code=413, detail="File too large")
+        buf.write(chunk)
+    return buf.getvalue()
+
+def prepare_image(file_data, target_size=None):
+    image = Image.open(io.BytesIO(file_data))
+    original_size = image.size
+    
+    if target_size is not None and image.format == 'JPEG':
+        image.draft('RGB', target_size)
+    
+    if image.mode != 'RGB':
+        if image.mode == 'RGBA':
+            alpha = image.getchannel('A')
+            if alpha.getextrema() == (255, 255):
+                image = image.convert('RGB')
+            else:
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=alpha)
+                image = background
+        else:
+            image = image.convert('RGB')
+    
+    if target_size is not None and image.size != target_size:
+        image = image.resize(target_size, Image.BILINEAR)
+    
+    return np.asarray(image, dtype=np.uint8), original_size
+
+def extract_features_from_file(extractor, image):
+    buf = io.BytesIO()
+    Image.fromarray(image).save(buf, 'JPEG', quality=95)
+    buf.seek(0)
+    return extractor.extract_features(buf)
+
+def run_batch(images, method, beam_width):
+    extractor = models["feature_extractor"]
+    generator = models["caption_generator"]
+    
+    if hasattr(extractor, "extract_features_batch"):
+        features = extractor.extract_features_batch(images)
+    elif hasattr(extractor, "extract_features_from_array"):
+        features = np.stack([extractor.extract_features_from_array(img) for img in images])
+    else:
+        features = np.stack([extract_features_from_file(extractor, img) for img in images])
+    
+    if hasattr(generator, "generate_caption_batch"):
+        captions = generator.generate_caption_batch(features, method=method, beam_width=beam_width)
+    elif method == "beam_search":
+        captions = [generator.generate_caption_beam_search(f, beam_width=beam_width) for f in features]
+    else:
+        captions = [generator.generate_caption_greedy(f) for f in features]
+    
+    return list(zip(features, captions))
+
+async def run_items_individually(items, method, beam_width):
+    loop = asyncio.get_running_loop()
+    for image, future in items:
+        try:
+            [output] = await loop.run_in_executor(executor, run_batch, [image], method, beam_width)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            continue
+        if not future.done():
+            future.set_result(output)
+
+async def batch_worker(queue):
+    config = get_config()
+    max_size = config["inference_batch_size"]
+    timeout = config["batch_timeout_ms"] / 1000
+    loop = asyncio.get_running_loop()
+    
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + timeout
+        while len(batch) < max_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        
+        groups = {}
+        for image, method, beam_width, future in batch:
+            groups.setdefault((method, beam_width), []).append((image, future))
+        
+        for (method, beam_width), items in groups.items():
+            futures = [future for _, future in items]
+            try:
+                outputs = await loop.run_in_executor(
+                    executor, run_batch, [image for image, _ in items], method, beam_width
+                )
+            except Exception as e:
+                logger.error(f"Batch inference failed, retrying items individually: {e}")
+                await run_items_individually(items, method, beam_width)
+                continue
+            for future, output in zip(futures, outputs):
+                if not future.done():
+                    future.set_result(output)
+
+async def submit_inference(image, method="beam_search", beam_width=3):
+    future = asyncio.get_running_loop().create_future()
+    await inference_queue.put((image, method, beam_width, future))
+    return await future
+
+def content_hash(file_data):
+    return hashlib.blake2b(file_data, digest_size=16).hexdigest()
+
+def cache_get(key):
+    entry = caption_cache.get(key)
+    if entry is not None:
+        caption_cache.move_to_end(key)
+    return entry
+
+def cache_put(key, entry, max_size):
+    if max_size <= 0:
+        return
+    caption_cache[key] = entry
+    caption_cache.move_to_end(key)
+    while len(caption_cache) > max_size:
+        caption_cache.popitem(last=False)
+
+async def caption_image(file_data, method="beam_search", beam_width=3):
+    config = get_config()
+    loop = asyncio.get_running_loop()
+    
+    digest = await loop.run_in_executor(executor, content_hash, file_data)
+    key = (digest, method, beam_width)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached
+    
+    async with inference_semaphore:
+        target_size = getattr(models["feature_extractor"], "target_size", None)
+        image, (width, height) = await loop.run_in_executor(
+            executor, prepare_image, file_data, target_size
+        )
+        features, caption = await submit_inference(image, method, beam_width)
+    
+    caption_words = caption.split()
+    confidence = models["caption_generator"].get_confidence_score(features, caption_words)
+    
+    entry = {
+        "caption": caption.title(),
+        "confidence_score": round(float(confidence), 3),
+        "word_count": len(caption_words),
+        "image_dimensions": [width, height],
+    }
+    cache_put(key, entry, config["cache_size"])
+    return entry
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     logger.error(f"Unhandled exception: {str(exc)}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"success": False, "error": "Internal server error", "detail": str(exc)}
     )
 
-@app.get("/", response_class=HTMLResponse)
-async def root():
-    html_content = f"""
+def render_root(status):
+    return f"""
     <!DOCTYPE html>
     <html>
     <head>
@@ -121,15 +361,21 @@ async def root():
     </head>
     <body>
         <h1>🖼️ Enhanced Image Caption Generator API</h1>
-        <div class="status {models.get('status', 'unknown')}">
-            <h3>Status: {models.get('status', 'Unknown').upper()} MODE</h3>
-            <p>{'Production AI models active' if models.get('status') == 'production' else 'Demo models active'}</p>
+        <div class="status {status}">
+            <h3>Status: {status.upper()} MODE</h3>
+            <p>{'Production AI models active' if status == 'production' else 'Demo models active'}</p>
         </div>
         <p><a href="/docs" target="_blank">📖 API Documentation</a></p>
     </body>
     </html>
     """
-    return HTMLResponse(content=html_content)
+
+@app.get("/", response_class=HTMLResponse)
+async def root():
+    return HTMLResponse(
+        content=app.state.root_html,
+        headers={"cache-control": "public, max-age=300"}
+    )
 
 @app.get("/health")
 async def health_check():
@@ -154,46 +400,18 @@ async def generate_caption(
     if method not in ["beam_search", "greedy_search"]:
         raise HTTPException(status_code=400, detail="Invalid method")
     
-    temp_path = None
     try:
-        file_data = await file.read()
+        file_data = await read_upload(file, config["max_file_size"])
         
-        if len(file_data) > config["max_file_size"]:
-            raise HTTPException(status_code=413, detail="File too large")
-        
-        image = Image.open(io.BytesIO(file_data))
+        result = await caption_image(file_data, method, beam_width)
         
-        if image.mode != 'RGB':
-            if image.mode == 'RGBA':
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[-1])
-                image = background
-            else:
-                image = image.convert('RGB')
-        
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-            image.save(temp_file.name, 'JPEG', quality=95)
-            temp_path = temp_file.name
-        
-        features = models["feature_extractor"].extract_features(temp_path)
-        
-        if method == "beam_search":
-            caption = models["caption_generator"].generate_caption_beam_search(
-                features, beam_width=beam_width
-            )
-        else:
-            caption = models["caption_generator"].generate_caption_greedy(features)
-        
-        caption_words = caption.split()
-        confidence = models["caption_generator"].get_confidence_score(features, caption_words)
-        
-        return JSONResponse({
+        return ORJSONResponse({
             "success": True,
-            "caption": caption.title(),
-            "confidence_score": round(float(confidence), 3),
+            "caption": result["caption"],
+            "confidence_score": result["confidence_score"],
             "method_used": method,
-            "word_count": len(caption_words),
-            "image_dimensions": list(image.size),
+            "word_count": result["word_count"],
+            "image_dimensions": result["image_dimensions"],
             "filename": file.filename,
             "model_mode": models.get("status", "unknown")
         })
@@ -203,12 +421,32 @@ async def generate_caption(
     except Exception as e:
         logger.error(f"Error processing {file.filename}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
-    finally:
-        if temp_path:
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
+
+async def process_batch_file(file, config):
+    try:
+        if not file.content_type.startswith("image/"):
+            return {
+                "filename": file.filename,
+                "success": False,
+                "error": "Invalid file type"
+            }
+        
+        file_data = await read_upload(file, config["max_file_size"])
+        result = await caption_image(file_data)
+        
+        return {
+            "filename": file.filename,
+            "success": True,
+            "caption": result["caption"],
+            "image_dimensions": result["image_dimensions"]
+        }
+        
+    except HTTPException as e:
+        return {
+            "filename": file.filename,
+            "success": False,
+            "error": e.detail
+        }
 
 @app.post("/batch-generate")
 async def batch_generate_captions(files: List[UploadFile] = File(...)):
@@ -217,74 +455,44 @@ async def batch_generate_captions(files: List[UploadFile] = File(...)):
     if len(files) > config["max_batch_size"]:
         raise HTTPException(status_code=400, detail=f"Max {config['max_batch_size']} files allowed")
     
-    results = []
-    successful_count = 0
-    temp_files = []
+    outcomes = await asyncio.gather(
+        *(process_batch_file(file, config) for file in files),
+        return_exceptions=True
+    )
     
-    try:
-        for i, file in enumerate(files, 1):
-            temp_path = None
-            try:
-                if not file.content_type.startswith("image/"):
-                    results.append({
-                        "filename": file.filename,
-                        "success": False,
-                        "error": "Invalid file type"
-                    })
-                    continue
-                
-                file_data = await file.read()
-                image = Image.open(io.BytesIO(file_data))
-                
-                if image.mode != 'RGB':
-                    if image.mode == 'RGBA':
-                        background = Image.new('RGB', image.size, (255, 255, 255))
-                        background.paste(image, mask=image.split()[-1])
-                        image = background
-                    else:
-                        image = image.convert('RGB')
-                
-                with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                    image.save(temp_file.name, 'JPEG', quality=95)
-                    temp_path = temp_file.name
-                temp_files.append(temp_path)
-                
-                features = models["feature_extractor"].extract_features(temp_path)
-                caption = models["caption_generator"].generate_caption_beam_search(features)
-                
-                results.append({
-                    "filename": file.filename,
-                    "success": True,
-                    "caption": caption.title(),
-                    "image_dimensions": list(image.size)
-                })
-                successful_count += 1
-                
-            except Exception as e:
-                results.append({
-                    "filename": file.filename,
-                    "success": False,
-                    "error": str(e)
-                })
-        
-        return JSONResponse({
-            "success": True,
-            "results": results,
-            "summary": {
-                "total_processed": len(files),
-                "successful": successful_count,
-                "failed": len(files) - successful_count,
-                "model_mode": models.get("status", "unknown")
+    results = []
+    for file, outcome in zip(files, outcomes):
+        if isinstance(outcome, Exception):
+            outcome = {
+                "filename": file.filename,
+                "success": False,
+                "error": str(outcome)
             }
-        })
-        
-    finally:
-        for temp_path in temp_files:
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
+        results.append(outcome)
+    
+    successful_count = sum(1 for result in results if result["success"])
+    
+    return ORJSONResponse({
+        "success": True,
+        "results": results,
+        "summary": {
+            "total_processed": len(files),
+            "successful": successful_count,
+            "failed": len(files) - successful_count,
+            "model_mode": models.get("status", "unknown")
+        }
+    })
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run("app:app", host="0.0.0.0", port=port, reload=False)
\ No newline at end of file
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=port,
+        reload=False,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "2")),
+        limit_concurrency=int(os.getenv("LIMIT_CONCURRENCY", "100")),
+        backlog=int(os.getenv("BACKLOG", "256")),
+    )
\ No newline at end of file
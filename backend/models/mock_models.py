@@ -1,122 +1,126 @@
 import numpy as np
-import time
 import random
 import logging
-from PIL import Image
 
 logger = logging.getLogger(__name__)
 
+CATEGORY_THRESHOLDS = np.array([0.3, 0.45, 0.6, 0.75, 0.85])
+CATEGORY_LABELS = ('nature', 'animals', 'people', 'urban', 'indoor', 'objects')
+
 class MockFeatureExtractor:
     def __init__(self):
         self.target_size = (299, 299)
         logger.info("Mock Feature Extractor initialized")
     
-    def extract_features(self, img_path):
-        try:
-            with Image.open(img_path) as img:
-                width, height = img.size
-                seed = hash(f"{width}x{height}") % 10000
-            
-            time.sleep(0.1)
-            np.random.seed(seed)
-            features = np.random.normal(0.5, 0.15, 2048)
-            features = np.clip(features, 0, 1)
-            return features.astype(np.float32)
-        except:
-            return np.random.random(2048).astype(np.float32)
+    def extract_features(self, img):
+        if not isinstance(img, np.ndarray):
+            raise TypeError(f"Expected an HWC numpy array, got {type(img).__name__}")
+        
+        height, width = img.shape[:2]
+        seed = ((width * 2654435761) ^ (height * 40503)) & 0x7fffffff
+        
+        rng = np.random.default_rng(seed)
+        features = rng.normal(0.5, 0.15, 2048).astype(np.float32, copy=False)
+        np.clip(features, 0, 1, out=features)
+        return features
+    
+    def extract_features_batch(self, imgs):
+        return np.stack([self.extract_features(img) for img in imgs])
 
 class MockCaptionGenerator:
+    CAPTIONS = {
+        'nature': (
+            "a beautiful landscape with mountains in the background",
+            "trees and grass in a natural outdoor setting",
+            "a scenic view of nature with clear blue sky"
+        ),
+        'people': (
+            "a group of people gathered together in a social setting",
+            "people enjoying time together in a friendly environment",
+            "individuals engaged in conversation"
+        ),
+        'urban': (
+            "a busy city street with buildings and infrastructure",
+            "modern architecture in an urban environment",
+            "tall buildings in a cityscape"
+        ),
+        'indoor': (
+            "an indoor space with furniture and decorations",
+            "a well-lit interior room with various objects",
+            "comfortable indoor environment"
+        ),
+        'objects': (
+            "various objects arranged in an organized manner",
+            "everyday items placed on a surface",
+            "a collection of useful objects"
+        ),
+        'animals': (
+            "a domestic animal in a comfortable environment",
+            "a pet showing natural behavior",
+            "an animal in its habitat"
+        )
+    }
+    
+    ENHANCED_CAPTIONS = {
+        'nature': (
+            "breathtaking natural landscape with majestic mountains and lush greenery",
+            "serene outdoor scenery with pristine beauty and peaceful atmosphere"
+        ),
+        'people': (
+            "vibrant gathering of people enjoying meaningful social connections",
+            "diverse group engaged in lively conversation and interaction"
+        ),
+        'urban': (
+            "dynamic urban environment with impressive architectural design",
+            "bustling metropolitan area with modern buildings and street life"
+        ),
+        'indoor': (
+            "elegantly designed indoor space with comfortable furnishings",
+            "well-appointed interior room with harmonious design elements"
+        ),
+        'objects': (
+            "carefully arranged collection of practical items and objects",
+            "assorted objects organized in a functional manner"
+        ),
+        'animals': (
+            "adorable animal displaying natural charm and characteristics",
+            "beloved pet in a nurturing and appropriate environment"
+        )
+    }
+    
+    MODIFIERS = ('bright', 'colorful', 'peaceful', 'modern')
+    
     def __init__(self, model_path=None, tokenizer_path=None):
         self.vocab_size = 8547
         self.max_length = 40
         
-        self.captions = {
-            'nature': [
-                "a beautiful landscape with mountains in the background",
-                "trees and grass in a natural outdoor setting",
-                "a scenic view of nature with clear blue sky"
-            ],
-            'people': [
-                "a group of people gathered together in a social setting",
-                "people enjoying time together in a friendly environment",
-                "individuals engaged in conversation"
-            ],
-            'urban': [
-                "a busy city street with buildings and infrastructure",
-                "modern architecture in an urban environment",
-                "tall buildings in a cityscape"
-            ],
-            'indoor': [
-                "an indoor space with furniture and decorations",
-                "a well-lit interior room with various objects",
-                "comfortable indoor environment"
-            ],
-            'objects': [
-                "various objects arranged in an organized manner",
-                "everyday items placed on a surface",
-                "a collection of useful objects"
-            ],
-            'animals': [
-                "a domestic animal in a comfortable environment",
-                "a pet showing natural behavior",
-                "an animal in its habitat"
-            ]
+        self.captions = self.CAPTIONS
+        self._pool = {
+            category: captions + self.ENHANCED_CAPTIONS.get(category, ())
+            for category, captions in self.CAPTIONS.items()
         }
         
         logger.info("Mock Caption Generator initialized")
     
     def _get_category(self, features):
-        mean_val = np.mean(features)
-        if mean_val < 0.3: return 'nature'
-        elif mean_val < 0.45: return 'animals'  
-        elif mean_val < 0.6: return 'people'
-        elif mean_val < 0.75: return 'urban'
-        elif mean_val < 0.85: return 'indoor'
-        else: return 'objects'
+        mean_val = float(np.mean(features))
+        return CATEGORY_LABELS[np.searchsorted(CATEGORY_THRESHOLDS, mean_val, side='right')]
     
     def generate_caption_greedy(self, image_features):
-        category = self._get_category(image_features)
-        caption = random.choice(self.captions[category])
+        caption = random.choice(self.captions[self._get_category(image_features)])
         
         if random.random() < 0.3:
-            modifiers = ['bright', 'colorful', 'peaceful', 'modern']
-            caption = f"{random.choice(modifiers)} {caption}"
+            caption = f"{random.choice(self.MODIFIERS)} {caption}"
         
         return caption
     
     def generate_caption_beam_search(self, image_features, beam_width=3):
-        category = self._get_category(image_features)
-        captions = self.captions[category]
-        
-        enhanced = {
-            'nature': [
-                "breathtaking natural landscape with majestic mountains and lush greenery",
-                "serene outdoor scenery with pristine beauty and peaceful atmosphere"
-            ],
-            'people': [
-                "vibrant gathering of people enjoying meaningful social connections",
-                "diverse group engaged in lively conversation and interaction"
-            ],
-            'urban': [
-                "dynamic urban environment with impressive architectural design",
-                "bustling metropolitan area with modern buildings and street life"
-            ],
-            'indoor': [
-                "elegantly designed indoor space with comfortable furnishings",
-                "well-appointed interior room with harmonious design elements"
-            ],
-            'objects': [
-                "carefully arranged collection of practical items and objects",
-                "assorted objects organized in a functional manner"
-            ],
-            'animals': [
-                "adorable animal displaying natural charm and characteristics",
-                "beloved pet in a nurturing and appropriate environment"
-            ]
-        }
-        
-        all_captions = captions + enhanced.get(category, [])
-        return random.choice(all_captions)
+        return random.choice(self._pool[self._get_category(image_features)])
+    
+    def generate_caption_batch(self, features, method="beam_search", beam_width=3):
+        if method == "beam_search":
+            return [self.generate_caption_beam_search(f, beam_width=beam_width) for f in features]
+        return [self.generate_caption_greedy(f) for f in features]
     
     def get_confidence_score(self, image_features, caption_words):
         base_confidence = 0.72
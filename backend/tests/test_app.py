@@ -0,0 +1,248 @@
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from PIL import Image
+from starlette.datastructures import UploadFile
+
+import app as app_module
+from app import app
+from models.mock_models import MockCaptionGenerator
+
+ORIGIN = "https://captionit-beta.vercel.app"
+
+
+def test_oversized_upload_rejected_with_cors_headers():
+    with TestClient(app) as client:
+        response = client.post(
+            "/generate-caption",
+            headers={"Origin": ORIGIN, "Content-Length": str(100 * 1024 * 1024)},
+            content=b"x",
+        )
+
+    assert response.status_code == 413
+    assert response.json() == {"detail": "File too large"}
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+
+
+def test_health_not_affected_by_body_limit():
+    with TestClient(app) as client:
+        response = client.get("/health", headers={"Origin": ORIGIN})
+
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+
+
+def png_bytes(size=(40, 30), color=(10, 120, 200, 255)):
+    buf = io.BytesIO()
+    Image.new("RGBA", size, color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_caption_works_across_repeated_lifespans():
+    for _ in range(2):
+        with TestClient(app) as client:
+            response = client.post(
+                "/generate-caption",
+                files={"file": ("a.png", png_bytes(), "image/png")},
+            )
+
+        assert response.status_code == 200
+        assert response.json()["success"] is True
+
+
+def run_worker(monkeypatch, items, fake_run_batch):
+    monkeypatch.setattr(app_module, "run_batch", fake_run_batch)
+    monkeypatch.setattr(app_module, "executor", ThreadPoolExecutor(max_workers=1))
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        futures = []
+        for image, method, beam_width in items:
+            future = loop.create_future()
+            futures.append(future)
+            queue.put_nowait((image, method, beam_width, future))
+        worker = asyncio.create_task(app_module.batch_worker(queue))
+        results = await asyncio.wait_for(
+            asyncio.gather(*futures, return_exceptions=True), timeout=2
+        )
+        worker.cancel()
+        return results
+
+    return asyncio.run(scenario())
+
+
+def test_batcher_groups_by_method_and_beam_width(monkeypatch):
+    calls = []
+
+    def fake_run_batch(images, method, beam_width):
+        calls.append((list(images), method, beam_width))
+        return [(None, f"{image}-{method}") for image in images]
+
+    results = run_worker(monkeypatch, [
+        ("a", "beam_search", 3),
+        ("b", "greedy_search", 3),
+        ("c", "beam_search", 3),
+        ("d", "beam_search", 5),
+    ], fake_run_batch)
+
+    assert sorted(calls) == sorted([
+        (["a", "c"], "beam_search", 3),
+        (["b"], "greedy_search", 3),
+        (["d"], "beam_search", 5),
+    ])
+    assert [caption for _, caption in results] == [
+        "a-beam_search", "b-greedy_search", "c-beam_search", "d-beam_search"
+    ]
+
+
+def test_batcher_flushes_at_batch_size_and_on_timeout(monkeypatch):
+    monkeypatch.setenv("INFERENCE_BATCH_SIZE", "2")
+    monkeypatch.setenv("BATCH_TIMEOUT_MS", "20")
+    sizes = []
+
+    def fake_run_batch(images, method, beam_width):
+        sizes.append(len(images))
+        return [(None, image) for image in images]
+
+    results = run_worker(monkeypatch, [
+        ("a", "beam_search", 3),
+        ("b", "beam_search", 3),
+        ("c", "beam_search", 3),
+    ], fake_run_batch)
+
+    assert sizes == [2, 1]
+    assert [caption for _, caption in results] == ["a", "b", "c"]
+
+
+def test_batcher_isolates_failing_item(monkeypatch):
+    def fake_run_batch(images, method, beam_width):
+        if "bad" in images:
+            raise ValueError("bad image")
+        return [(None, image) for image in images]
+
+    results = run_worker(monkeypatch, [
+        ("a", "beam_search", 3),
+        ("bad", "beam_search", 3),
+        ("c", "beam_search", 3),
+    ], fake_run_batch)
+
+    assert results[0] == (None, "a")
+    assert isinstance(results[1], ValueError)
+    assert results[2] == (None, "c")
+
+
+def read(data, max_size, size=None):
+    upload = UploadFile(io.BytesIO(data), size=size)
+    return asyncio.run(app_module.read_upload(upload, max_size))
+
+
+def test_read_upload_rejects_running_total_over_limit(monkeypatch):
+    monkeypatch.setattr(app_module, "READ_CHUNK_SIZE", 8)
+    with pytest.raises(HTTPException) as exc:
+        read(b"\x89PNG\r\n\x1a\n" + b"x" * 20, max_size=16)
+    assert exc.value.status_code == 413
+
+
+def test_read_upload_rejects_declared_size_over_limit():
+    with pytest.raises(HTTPException) as exc:
+        read(png_bytes(), max_size=10, size=10_000)
+    assert exc.value.status_code == 413
+
+
+def test_read_upload_rejects_unknown_magic_bytes():
+    with pytest.raises(HTTPException) as exc:
+        read(b"not an image at all", max_size=1024)
+    assert exc.value.status_code == 400
+
+
+def test_read_upload_returns_full_body():
+    data = png_bytes()
+    assert read(data, max_size=len(data)) == data
+
+
+@pytest.fixture
+def empty_cache():
+    app_module.caption_cache.clear()
+    yield app_module.caption_cache
+    app_module.caption_cache.clear()
+
+
+def test_cache_evicts_least_recently_used(empty_cache):
+    app_module.cache_put("a", {"caption": "a"}, max_size=2)
+    app_module.cache_put("b", {"caption": "b"}, max_size=2)
+    assert app_module.cache_get("a") == {"caption": "a"}
+
+    app_module.cache_put("c", {"caption": "c"}, max_size=2)
+
+    assert app_module.cache_get("b") is None
+    assert list(empty_cache) == ["a", "c"]
+
+
+def test_cache_disabled_when_size_is_zero(empty_cache, monkeypatch):
+    monkeypatch.setenv("CACHE_SIZE", "0")
+    app_module.cache_put("a", {"caption": "a"}, max_size=0)
+    assert app_module.cache_get("a") is None
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/generate-caption",
+            files={"file": ("a.png", png_bytes(), "image/png")},
+        )
+        assert response.status_code == 200
+        assert len(empty_cache) == 0
+
+
+@pytest.mark.parametrize("mean_val, category", [
+    (0.29, "nature"),
+    (0.3, "animals"),
+    (0.45, "people"),
+    (0.6, "urban"),
+    (0.75, "indoor"),
+    (0.85, "objects"),
+])
+def test_category_thresholds_are_right_closed(mean_val, category):
+    generator = MockCaptionGenerator()
+    features = np.array([mean_val])
+    assert generator._get_category(features) == category
+
+
+def test_batch_generate_isolates_per_file_errors():
+    with TestClient(app) as client:
+        response = client.post(
+            "/batch-generate",
+            files=[
+                ("files", ("good.png", png_bytes(), "image/png")),
+                ("files", ("junk.png", b"not an image", "image/png")),
+                ("files", ("notes.txt", b"hello", "text/plain")),
+            ],
+        )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [r["success"] for r in body["results"]] == [True, False, False]
+    assert body["results"][1]["error"] == "Unsupported image format"
+    assert body["results"][2]["error"] == "Invalid file type"
+    assert body["summary"]["successful"] == 1
+    assert body["summary"]["failed"] == 2
+
+
+@pytest.mark.parametrize("origin, allowed", [
+    ("https://captionit-git-main-team.vercel.app", True),
+    ("https://evil.example.com.vercel.app", False),
+    ("https://preview.vercel.app:8443", False),
+])
+def test_vercel_preview_origin_regex(origin, allowed):
+    with TestClient(app) as client:
+        response = client.get("/health", headers={"Origin": origin})
+
+    assert ("access-control-allow-origin" in response.headers) is allowed